@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from correlation_service import _pairwise_stats, _corr_from_stats, _rolling_beta, _min_periods
+
+# Tüm evren (500 hisse) için korelasyon / beta hesap süresi ölçümü.
+# Sentetik veri kullanır, ağ erişimi gerektirmez:
+#   python bench_correlation.py
+
+N_SYMBOLS = 500
+N_DAYS = 750
+WINDOWS = [20, 60, 250]
+MISSING_RATIO = 0.02
+
+
+def make_returns(seed=42):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.015, N_DAYS)
+    betas = rng.uniform(0.3, 1.5, N_SYMBOLS)
+    noise = rng.normal(0, 0.02, (N_DAYS, N_SYMBOLS))
+    values = market[:, None] * betas[None, :] + noise
+    values[rng.random(values.shape) < MISSING_RATIO] = np.nan
+    dates = pd.bdate_range("2023-01-02", periods=N_DAYS).strftime("%Y-%m-%d")
+    symbols = [f"S{i:03d}" for i in range(N_SYMBOLS)]
+    return pd.DataFrame(values, index=dates, columns=symbols), market
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<45} {best * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    returns, market = make_returns()
+    print(f"Evren: {N_SYMBOLS} hisse x {N_DAYS} gün\n")
+
+    for window in WINDOWS:
+        print(f"--- Pencere: {window} gün ---")
+
+        def full():
+            block = returns.iloc[-window:].values
+            return _corr_from_stats(_pairwise_stats(block), _min_periods(window))
+
+        matrix = timed("Korelasyon matrisi (tam hesap)", full)
+
+        expected = returns.iloc[-window:].corr(min_periods=_min_periods(window)).values
+        err = np.nanmax(np.abs(matrix - expected))
+        print(f"{'pandas .corr() ile maks. fark':<45} {err:12.2e}")
+
+        timed("pandas .corr() (karşılaştırma)",
+              lambda: returns.iloc[-window:].corr(min_periods=_min_periods(window)), repeat=1)
+        timed("Kayan beta (tüm evren, tüm tarih)",
+              lambda: _rolling_beta(returns.values, market, window, _min_periods(window)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+
+# --- Devre Kesici (Circuit Breaker) ---
+# Her dış kaynak / uç nokta sınıfı (ör. "yahoo:quote", "yahoo:detail")
+# için ayrı bir devre tutulur. Art arda hata (veya çok yavaş yanıt)
+# eşiği aşılınca devre açılır ve istekler kaynağa hiç gitmeden hemen
+# CircuitOpenError alır. Kurtarma arka planda `probe` ile denenir; probe
+# yoksa bekleme süresi dolunca tek bir deneme isteğine izin verilir.
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} devresi açık ({retry_in:.0f} sn sonra denenecek)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_reset_timeout=300,
+                 slow_call=10.0, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.slow_call = slow_call
+        self.probe = probe
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_until = 0
+        self.last_error = None
+        self._timeout = reset_timeout
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        self._before_call()
+        start = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._on_failure(e)
+            raise
+        elapsed = time.time() - start
+        if elapsed > self.slow_call:
+            self._on_failure(f"yavaş yanıt ({elapsed:.1f} sn)")
+        else:
+            self._on_success()
+        return result
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.time()
+            if self.state == self.OPEN and self.probe is None and now >= self.opened_until:
+                # Probe yok: tek bir deneme isteğine izin ver, diğerleri beklemesin
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.name, max(0, self.opened_until - now))
+
+    def _on_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"--- {self.name} devresi kapandı (kaynak tekrar erişilebilir) ---")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._timeout = self.reset_timeout
+
+    def _on_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.OPEN:
+                return  # Açılmadan önce başlamış, geç biten çağrı
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        # Kilit altında çağrılır
+        if self.state != self.OPEN:
+            print(f"--- {self.name} devresi açıldı: {self.last_error} ---")
+        self.state = self.OPEN
+        self.opened_until = time.time() + self._timeout
+        if self.probe is not None:
+            timer = threading.Timer(self._timeout, self._run_probe)
+            timer.daemon = True
+            timer.start()
+        self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+
+    def _run_probe(self):
+        if self.state != self.OPEN:
+            return
+        try:
+            ok = self.probe()
+        except Exception as e:
+            ok = False
+            self.last_error = str(e)
+        if ok:
+            self._on_success()
+        else:
+            with self._lock:
+                self._open()
+
+    def status(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(max(0, self.opened_until - time.time()), 1) if self.state != self.CLOSED else 0,
+            "last_error": self.last_error,
+        }
+
+
+BREAKERS = {}
+
+
+def get_breaker(name, **kwargs):
+    """
+    İsme göre devre kesiciyi döner, yoksa verilen ayarlarla oluşturur.
+    """
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(name, **kwargs)
+    return BREAKERS[name]
+
+
+def get_breaker_statuses():
+    return [b.status() for b in BREAKERS.values()]
+
+
+# --- Son Bilinen İyi Veri (Stale-While-Revalidate) ---
+# Başarılı yanıtlar bellekte ve diskte tutulur (yeniden başlatmadan sonra
+# da kullanılabilsin diye); kaynak erişilemezken bu kopya "stale": true ve
+# yaşı (saniye) ile birlikte döner. Disk yazımı SAVE_DELAY saniyede bir
+# toplu yapılır.
+LAST_GOOD_FILE = os.path.join(os.path.dirname(__file__), "last_good_cache.json")
+SAVE_DELAY = 5
+
+_GOOD_LOCK = threading.Lock()
+_SAVE_TIMER = None
+
+
+def load_last_good():
+    if os.path.exists(LAST_GOOD_FILE):
+        try:
+            with open(LAST_GOOD_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            return {
+                (kind, key): (entry[0], entry[1])
+                for kind, items in raw.items()
+                for key, entry in items.items()
+            }
+        except:
+            pass
+    return {}
+
+
+def save_last_good():
+    global _SAVE_TIMER
+    with _GOOD_LOCK:
+        _SAVE_TIMER = None
+        raw = {}
+        for (kind, key), entry in LAST_GOOD.items():
+            raw.setdefault(kind, {})[key] = list(entry)
+        try:
+            text = json.dumps(raw, ensure_ascii=False, default=str)
+        except:
+            return
+    try:
+        with open(LAST_GOOD_FILE, "w", encoding="utf-8") as f:
+            f.write(text)
+    except:
+        pass
+
+
+LAST_GOOD = load_last_good()
+
+
+def remember(kind, key, data):
+    global _SAVE_TIMER
+    if data:
+        with _GOOD_LOCK:
+            LAST_GOOD[(kind, key)] = (time.time(), data)
+            if _SAVE_TIMER is None:
+                _SAVE_TIMER = threading.Timer(SAVE_DELAY, save_last_good)
+                _SAVE_TIMER.daemon = True
+                _SAVE_TIMER.start()
+    return data
+
+
+def lookup(kind, key, is_valid):
+    """
+    Son iyi veri hâlâ geçerliyse (is_valid(zaman) True) döner; dış kaynağa gidilmez.
+    """
+    entry = LAST_GOOD.get((kind, key))
+    if entry and is_valid(entry[0]):
+        return entry[1]
+    return None
+
+
+def recall(kind, key):
+    entry = LAST_GOOD.get((kind, key))
+    if not entry:
+        return None
+    ts, data = entry
+    return mark_stale(data, ts)
+
+
+def mark_stale(data, ts):
+    stale = dict(data)
+    stale["stale"] = True
+    stale["staleAge"] = int(time.time() - ts)
+    return stale
@@ -0,0 +1,404 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from circuit_breaker import get_breaker
+from market_calendar import last_settled_session
+from profiling import span
+
+# --- Korelasyon / Beta Analitiği ---
+# Günlük kapanış fiyatları yerel bir JSON dosyasında tutulur ve her
+# güncellemede sadece son tarihten sonrası indirilir. Korelasyon matrisleri
+# ve betalar pencere bazında cache'lenir; fiyat geçmişi değişince (yeni bar)
+# tek seferde matris çarpımlarıyla yeniden hesaplanır (500 hisse ~10 ms).
+
+PRICE_HISTORY_FILE = os.path.join(os.path.dirname(__file__), "price_history.json")
+
+INDEX_SYMBOL = "XU100"     # BIST 100 endeksi (beta için piyasa vekili)
+HISTORY_DAYS = 750         # Saklanan maksimum işlem günü (~3 yıl)
+MIN_WINDOW = 20
+MAX_WINDOW = 500
+DEFAULT_WINDOW = 60
+MAX_SIMILAR = 50
+FULL_RELOAD_DAYS = 7       # Bölünme/temettü düzeltmeleri için tam yeniden indirme
+PRICE_ATOL = 1e-4          # Kapanış karşılaştırma toleransı (düşük fiyatlı hisseler için mutlak)
+
+_LOCK = threading.RLock()
+HISTORY_BREAKER = get_breaker("yahoo:history", failure_threshold=2, reset_timeout=300, slow_call=180.0)
+
+
+def load_price_history():
+    if os.path.exists(PRICE_HISTORY_FILE):
+        try:
+            with open(PRICE_HISTORY_FILE, "r") as f:
+                raw = json.load(f)
+            frame = pd.DataFrame(raw.get("closes", {}), index=raw.get("dates", []), dtype="float64")
+            return frame.sort_index(), raw.get("full_reload")
+        except:
+            pass
+    return pd.DataFrame(dtype="float64"), None
+
+
+def save_price_history(frame, full_reload):
+    try:
+        closes = {
+            col: [None if v != v else float(v) for v in frame[col].values]
+            for col in frame.columns
+        }
+        with span("cache.write.price_history"), open(PRICE_HISTORY_FILE, "w") as f:
+            json.dump({"dates": list(frame.index), "full_reload": full_reload, "closes": closes}, f)
+    except:
+        pass
+
+
+PRICE_FRAME, LAST_FULL_RELOAD = load_price_history()
+_REVISION = 0
+_RETURNS = None
+_CORR_CACHE = {}         # window -> (revision, dict)
+_BETA_CACHE = {}         # window -> (revision, DataFrame)
+
+
+def _yf_symbol(symbol):
+    symbol = symbol.upper()
+    return symbol if "." in symbol else f"{symbol}.IS"
+
+
+def _download_closes(symbols, start):
+    """
+    Verilen semboller için `start` tarihinden itibaren günlük kapanışları
+    tek bir toplu istekle indirir. Sütunlar .IS eki olmadan döner.
+    """
+    yf_symbols = [_yf_symbol(s) for s in symbols]
+    with span("yfinance.download"):
+        df = yf.download(
+            yf_symbols, start=start, interval="1d", auto_adjust=True,
+            progress=False, threads=True, group_by="column"
+        )
+    if df is None or df.empty:
+        return pd.DataFrame(dtype="float64")
+
+    closes = df["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(yf_symbols[0])
+    closes = closes.rename(columns=lambda c: c.replace(".IS", ""))
+    closes.index = [d.strftime("%Y-%m-%d") for d in closes.index]
+    return closes.astype("float64").dropna(how="all")
+
+
+def update_price_history(symbols):
+    """
+    Yerel fiyat geçmişini günceller. Normalde sadece son iki kayıtlı günden
+    itibaren indirir; FULL_RELOAD_DAYS geçtiyse tüm geçmişi yeniler.
+    Sadece kapanışı kesinleşmiş seansların barları saklanır.
+    Eklenen/değişen gün sayısını döner; indirme başarısızsa None.
+    """
+    global PRICE_FRAME, LAST_FULL_RELOAD, _REVISION, _RETURNS
+
+    symbols = [s.upper().replace(".IS", "") for s in symbols]
+    if INDEX_SYMBOL not in symbols:
+        symbols.append(INDEX_SYMBOL)
+
+    with _LOCK:
+        old = PRICE_FRAME
+        now = datetime.now()
+        full_reload = (
+            old.empty
+            or not LAST_FULL_RELOAD
+            or now - datetime.fromisoformat(LAST_FULL_RELOAD) > timedelta(days=FULL_RELOAD_DAYS)
+            or any(s not in old.columns for s in symbols)
+        )
+
+    full_start = (now - timedelta(days=int(HISTORY_DAYS * 1.5))).strftime("%Y-%m-%d")
+    # Son kayıtlı gün de yeniden indirilir (üzerine yazılır); revizyon
+    # kontrolü için ondan önceki gün de pencereye alınır.
+    start = full_start if full_reload else old.index[max(0, len(old.index) - 2)]
+    settled = last_settled_session().isoformat()
+
+    try:
+        new = HISTORY_BREAKER.call(_download_closes, symbols, start)
+    except Exception as e:
+        print(f"Fiyat geçmişi indirilemedi: {e}")
+        return None
+    # Seans içi / kesinleşmemiş bar gerçek bir günlük getiri değildir
+    new = new[new.index <= settled]
+    if new.empty:
+        return 0
+
+    # Zaten kayıtlı bir günün kapanışı değiştiyse (bölünme, bedelsiz, temettü)
+    # Yahoo o sembolün tüm geçmişini yeniden düzeltmiştir; eski barlarla
+    # karıştırmamak için o sembollerin tüm geçmişi yeniden indirilir.
+    if not full_reload:
+        revised = _revised_symbols(old, new)
+        if revised:
+            print(f"Düzeltilmiş geçmiş yeniden indiriliyor: {', '.join(revised)}")
+            try:
+                full = HISTORY_BREAKER.call(_download_closes, revised, full_start)
+            except Exception as e:
+                print(f"Fiyat geçmişi indirilemedi: {e}")
+                return None
+            full = full[full.index <= settled]
+            new = full.combine_first(new.drop(columns=revised))
+            old = old.drop(columns=revised)
+
+    with _LOCK:
+        # Değişen ilk günü bul (yeni gün veya güncellenmiş kapanış)
+        aligned_old = old.reindex(index=new.index, columns=new.columns)
+        new_vals = new.values
+        changed = ~(np.isclose(new_vals, aligned_old.values, atol=PRICE_ATOL, equal_nan=True) | np.isnan(new_vals))
+        changed_dates = new.index[changed.any(axis=1)]
+        if len(changed_dates) == 0:
+            if full_reload:
+                LAST_FULL_RELOAD = now.isoformat()
+                save_price_history(PRICE_FRAME, LAST_FULL_RELOAD)
+            return 0
+
+        merged = new.combine_first(old).sort_index()
+        PRICE_FRAME = merged.iloc[-HISTORY_DAYS:]
+        if full_reload:
+            LAST_FULL_RELOAD = now.isoformat()
+        _REVISION += 1
+        _RETURNS = None
+        save_price_history(PRICE_FRAME, LAST_FULL_RELOAD)
+
+    return len(changed_dates)
+
+
+def _revised_symbols(old, new):
+    """
+    Daha önce kaydedilmiş günlerde kapanışı farklı gelen semboller. Son
+    kayıtlı gün hariçtir; o gün her güncellemede yeniden yazılır ve farkı
+    tek başına geçmişin düzeltildiğini göstermez.
+    """
+    overlap = new.index[new.index < old.index[-1]]
+    if len(overlap) == 0:
+        return []
+    old_vals = old.reindex(index=overlap, columns=new.columns).values
+    new_vals = new.loc[overlap].values
+    diff = ~(np.isclose(new_vals, old_vals, atol=PRICE_ATOL) | np.isnan(new_vals) | np.isnan(old_vals))
+    return list(new.columns[diff.any(axis=0)])
+
+
+def _get_returns():
+    """
+    Günlük basit getiriler (tarih x sembol). Endeks sütunu hariçtir.
+    """
+    global _RETURNS
+    if _RETURNS is None:
+        closes = PRICE_FRAME.drop(columns=[INDEX_SYMBOL], errors="ignore")
+        closes = closes.reindex(sorted(closes.columns), axis=1)
+        _RETURNS = (closes / closes.shift(1) - 1).iloc[1:]
+    return _RETURNS
+
+
+def _market_returns(returns):
+    """
+    Piyasa vekili getirisi: XU100 varsa o, yoksa eşit ağırlıklı evren ortalaması.
+    """
+    if INDEX_SYMBOL in PRICE_FRAME.columns and PRICE_FRAME[INDEX_SYMBOL].notna().sum() > 1:
+        idx = PRICE_FRAME[INDEX_SYMBOL]
+        return (idx / idx.shift(1) - 1).reindex(returns.index).values
+    with np.errstate(invalid="ignore"):
+        return np.nanmean(returns.values, axis=1)
+
+
+# --- Vektörel İstatistikler ---
+
+def _pairwise_stats(X):
+    """
+    Eksik veriye (NaN) dayanıklı ikili korelasyon için yeterli istatistikler.
+    Hepsi (N x N) matrisler; sadece ortak gözlem günleri kullanılır.
+    """
+    M = ~np.isnan(X)
+    Xf = np.where(M, X, 0.0)
+    Mf = M.astype(np.float64)
+    return {
+        "n": Mf.T @ Mf,             # ortak gözlem sayısı
+        "sx": Xf.T @ Mf,            # i'nin toplamı (j'nin de olduğu günler)
+        "sxx": (Xf * Xf).T @ Mf,    # i'nin kareler toplamı (aynı günler)
+        "sxy": Xf.T @ Xf,           # çarpım toplamı
+    }
+
+
+def _corr_from_stats(stats, min_periods):
+    n, sx = stats["n"], stats["sx"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = stats["sxy"] - sx * sx.T / n
+        var_i = stats["sxx"] - sx * sx / n
+        denom = var_i * var_i.T
+        corr = np.where(denom > 0, cov / np.sqrt(denom), np.nan)
+    corr[n < min_periods] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _rolling_beta(X, m, window, min_periods):
+    """
+    Tüm semboller için kayan beta; kümülatif toplamlarla O(T x N).
+    """
+    valid = ~np.isnan(X) & ~np.isnan(m)[:, None]
+    Xf = np.where(valid, X, 0.0)
+    mf = np.where(valid, np.nan_to_num(m)[:, None], 0.0)
+
+    def rolling_sum(a):
+        c = np.cumsum(a, axis=0)
+        c[window:] = c[window:] - c[:-window]
+        return c
+
+    n = rolling_sum(valid.astype(np.float64))
+    sx = rolling_sum(Xf)
+    sm = rolling_sum(mf)
+    sxm = rolling_sum(Xf * mf)
+    smm = rolling_sum(mf * mf)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_m = smm - sm * sm / n
+        beta = np.where(var_m > 0, (sxm - sx * sm / n) / var_m, np.nan)
+    beta[n < min_periods] = np.nan
+    return beta
+
+
+def _min_periods(window):
+    return max(10, window // 2)
+
+
+def _validate_window(window):
+    if window < MIN_WINDOW or window > MAX_WINDOW:
+        raise ValueError(f"Pencere {MIN_WINDOW}-{MAX_WINDOW} gün arasında olmalı")
+
+
+def _validate_limit(limit):
+    if limit < 1 or limit > MAX_SIMILAR:
+        raise ValueError(f"Limit 1-{MAX_SIMILAR} arasında olmalı")
+
+
+def _get_correlation(window):
+    """
+    Son `window` günün korelasyon matrisi; fiyat geçmişi değişmedikçe cache'ten.
+    """
+    _validate_window(window)
+    with _LOCK:
+        cached = _CORR_CACHE.get(window)
+        if cached and cached[0] == _REVISION:
+            return cached[1]
+        returns = _get_returns()
+        if len(returns) == 0:
+            return None
+        block = returns.iloc[-window:]
+        result = {
+            "symbols": list(block.columns),
+            "as_of": block.index[-1],
+            "matrix": _corr_from_stats(_pairwise_stats(block.values), _min_periods(window)),
+        }
+        _CORR_CACHE[window] = (_REVISION, result)
+        return result
+
+
+def _clean(values):
+    return [None if v != v else round(float(v), 4) for v in values]
+
+
+def get_correlation_matrix(window=DEFAULT_WINDOW, symbols=None):
+    """
+    Getiri korelasyon matrisi. `symbols` verilirse sadece o alt küme döner.
+    """
+    corr = _get_correlation(window)
+    if corr is None:
+        return None
+    matrix = corr["matrix"]
+    all_symbols = corr["symbols"]
+    if symbols:
+        pos = {s: i for i, s in enumerate(all_symbols)}
+        wanted = [s.upper().replace(".IS", "") for s in symbols]
+        wanted = [s for s in wanted if s in pos]
+        idx = [pos[s] for s in wanted]
+        matrix = matrix[np.ix_(idx, idx)]
+    else:
+        wanted = all_symbols
+    return {
+        "window": window,
+        "as_of": corr["as_of"],
+        "symbols": wanted,
+        "matrix": [_clean(row) for row in matrix],
+    }
+
+
+def get_similar_stocks(symbol, window=DEFAULT_WINDOW, limit=10):
+    """
+    Verilen hisseyle en yüksek getiri korelasyonuna sahip hisseler.
+    """
+    symbol = symbol.upper().replace(".IS", "")
+    _validate_limit(limit)
+    corr = _get_correlation(window)
+    if corr is None or symbol not in corr["symbols"]:
+        return None
+    i = corr["symbols"].index(symbol)
+    row = corr["matrix"][i].copy()
+    row[i] = np.nan
+    order = np.argsort(np.where(np.isnan(row), -np.inf, row))[::-1]
+    items = [
+        {"symbol": corr["symbols"][j], "correlation": round(float(row[j]), 4)}
+        for j in order[:limit] if row[j] == row[j]
+    ]
+    return {"symbol": symbol, "window": window, "as_of": corr["as_of"], "items": items}
+
+
+def _get_betas(window):
+    _validate_window(window)
+    with _LOCK:
+        cached = _BETA_CACHE.get(window)
+        if cached and cached[0] == _REVISION:
+            return cached[1]
+        returns = _get_returns()
+        if len(returns) == 0:
+            return None
+        beta = _rolling_beta(returns.values, _market_returns(returns), window, _min_periods(window))
+        frame = pd.DataFrame(beta, index=returns.index, columns=returns.columns)
+        _BETA_CACHE[window] = (_REVISION, frame)
+        return frame
+
+
+def get_rolling_beta(symbol, window=DEFAULT_WINDOW):
+    """
+    Tek hissenin piyasa vekiline karşı kayan beta serisi.
+    """
+    symbol = symbol.upper().replace(".IS", "")
+    betas = _get_betas(window)
+    if betas is None or symbol not in betas.columns:
+        return None
+    series = betas[symbol].dropna()
+    return {
+        "symbol": symbol,
+        "window": window,
+        "benchmark": INDEX_SYMBOL if INDEX_SYMBOL in PRICE_FRAME.columns else "equal_weight",
+        "beta": round(float(series.iloc[-1]), 4) if len(series) else None,
+        "dates": list(series.index),
+        "values": _clean(series.values),
+    }
+
+
+def get_all_betas(window=DEFAULT_WINDOW):
+    """
+    Evrendeki tüm hisselerin en güncel betası.
+    """
+    betas = _get_betas(window)
+    if betas is None:
+        return None
+    last = betas.iloc[-1]
+    return {
+        "window": window,
+        "as_of": betas.index[-1],
+        "betas": {s: v for s, v in zip(betas.columns, _clean(last.values)) if v is not None},
+    }
+
+
+def get_history_info():
+    return {
+        "symbols": len(PRICE_FRAME.columns),
+        "days": len(PRICE_FRAME),
+        "last_date": PRICE_FRAME.index[-1] if len(PRICE_FRAME) else None,
+        "windows": sorted(_CORR_CACHE.keys()),
+    }
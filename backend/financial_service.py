@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import os
 import urllib3
@@ -6,6 +6,10 @@ import pandas as pd
 import ssl
 import requests
 
+from profiling import span
+from circuit_breaker import get_breaker, mark_stale
+from market_calendar import reporting_window, next_quarter
+
 # SSL sertifika hatasını atlamak için (Özellikle Mac cihazlarda gerekebilir)
 ssl._create_default_https_context = ssl._create_unverified_context
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -39,13 +43,16 @@ def load_financial_cache():
 
 def save_financial_cache(cache):
     try:
-        with open(FINANCIAL_CACHE_FILE, "w", encoding="utf-8") as f:
+        with span("cache.write.financials"), open(FINANCIAL_CACHE_FILE, "w", encoding="utf-8") as f:
             json.dump(cache, f, ensure_ascii=False, indent=2)
     except:
         pass
 
 FINANCIAL_CACHE = load_financial_cache()
 
+# İş Yatırım kaynağı için devre kesici (probe yok: süre dolunca tek deneme)
+FINANCIAL_BREAKER = get_breaker("isyatirim:financials", failure_threshold=3, reset_timeout=120, slow_call=30.0)
+
 def get_financial_group(symbol):
     """
     isyatirimhisse kütüphanesinin beklediği grup (1, 2, 3)
@@ -94,6 +101,34 @@ def get_periods(count=12):
             
     return periods
 
+def financials_valid_until(cached):
+    """
+    Cache'deki mali tabloların tekrar kontrol edileceği zaman.
+    En güncel beklenen dönem zaten varsa bir sonraki çeyreğin yayın
+    penceresine kadar beklenir; yoksa pencere içinde günlük, pencere
+    geçmişse (geç açıklayan şirket) haftalık kontrol edilir.
+    """
+    last_updated = datetime.fromisoformat(cached["last_updated"])
+    periods = set(cached.get("periods", []))
+    today = datetime.now().date()
+
+    # Yayın penceresi başlamış en güncel çeyrek
+    latest = None
+    for y, p in get_periods(4):
+        if reporting_window(y, p)[0] <= today:
+            latest = (y, p)
+            break
+    if latest is None:
+        return last_updated + timedelta(days=7)
+
+    if f"{latest[0]}/{latest[1]}" in periods:
+        ny, np_ = next_quarter(*latest)
+        return datetime.combine(reporting_window(ny, np_)[0], datetime.min.time())
+
+    if today <= reporting_window(*latest)[1]:
+        return last_updated + timedelta(days=1)
+    return last_updated + timedelta(days=7)
+
 def fetch_financials(symbol):
     """
     isyatirimhisse kütüphanesini kullanarak son 12 bilançoyu çeker.
@@ -112,13 +147,14 @@ def fetch_financials(symbol):
     
     try:
         # Kütüphane yardımıyla veriyi çekelim
-        df = isy_fetch(
-            symbols=symbol, 
-            start_year=str(start_year), 
-            end_year=str(curr_year), 
-            exchange='TRY',
-            financial_group=group
-        )
+        with span("isyatirim.fetch"):
+            df = isy_fetch(
+                symbols=symbol, 
+                start_year=str(start_year), 
+                end_year=str(curr_year), 
+                exchange='TRY',
+                financial_group=group
+            )
         
         if df is None or df.empty:
             print(f"Uyarı: {symbol} için veri bulunamadı.")
@@ -170,24 +206,32 @@ def fetch_financials(symbol):
         print(f"isyatirimhisse hatası ({symbol}): {str(e)}")
         import traceback
         traceback.print_exc()
-        return None
+        raise
 
 def get_stock_financials(symbol):
     """
     Önce cache'e bakar, yoksa veya eskiyse çeker.
+    Kaynak hata verirse (veya devre açıksa) eski cache "stale" olarak döner.
     """
     symbol = symbol.upper().replace(".IS", "")
     cached = FINANCIAL_CACHE.get(symbol)
     
-    # Eğer cache yoksa veya 30 günden eskiyse güncelle (Mali tablolar nadir değişir)
+    # Eğer cache yoksa veya bilanço takvimine göre yeni dönem bekleniyorsa güncelle
     should_update = True
     if cached:
-        last_updated = datetime.fromisoformat(cached["last_updated"])
-        if (datetime.now() - last_updated).days < 30:
+        if datetime.now() < financials_valid_until(cached):
             should_update = False
             
     if should_update:
-        return fetch_financials(symbol)
+        try:
+            fresh = FINANCIAL_BREAKER.call(fetch_financials, symbol)
+            if fresh:
+                return fresh
+        except Exception as e:
+            print(f"Mali tablo güncellenemedi ({symbol}): {e}")
+        if cached:
+            return mark_stale(cached, datetime.fromisoformat(cached["last_updated"]).timestamp())
+        return None
     
     return cached
 
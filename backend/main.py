@@ -2,6 +2,7 @@ import requests
 import re
 import yfinance as yf
 from fastapi import FastAPI, HTTPException, Body
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
 import uvicorn
@@ -11,6 +12,14 @@ import time
 from concurrent.futures import ThreadPoolExecutor
 
 from financial_service import get_stock_financials, get_cached_financials_count
+from circuit_breaker import get_breaker, get_breaker_statuses, CircuitOpenError, remember, recall, lookup
+from market_calendar import is_fresh, seconds_until_history_refresh, get_calendar_status, SECTOR_RESCAN
+import profiling
+from profiling import span, bind_context, ProfilingMiddleware
+from correlation_service import (
+    get_correlation_matrix, get_similar_stocks, get_rolling_beta, get_all_betas,
+    get_history_info, update_price_history, DEFAULT_WINDOW
+)
 
 # --- Sektör ve Sektör Grubu Çevirileri ---
 SECTOR_TRANSLATIONS = {
@@ -53,25 +62,54 @@ INDUSTRY_TRANSLATIONS = {
     "Building Materials": "Yapı Malzemeleri"
 }
 
+TRANSLATE_BREAKER = get_breaker("google:translate", failure_threshold=3, reset_timeout=60, slow_call=4.0)
+
+def _google_translate(text, target_lang):
+    url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=auto&tl={target_lang}&dt=t&q={requests.utils.quote(text)}"
+    r = requests.get(url, timeout=5)
+    r.raise_for_status()
+    result = r.json()
+    return "".join([sentence[0] for sentence in result[0]])
+
 def translate_text(text, target_lang='tr'):
     # Basit bir Google Translate (Unofficial) çağrısı deneyelim
+    # Çeviri servisi erişilemezse (devre açık) orijinal metin hemen döner.
     if not text or text == "Şirket açıklaması bulunamadı." or len(text) < 10:
         return text
     try:
-        url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=auto&tl={target_lang}&dt=t&q={requests.utils.quote(text)}"
-        r = requests.get(url, timeout=5)
-        if r.status_code == 200:
-            result = r.json()
-            translated = "".join([sentence[0] for sentence in result[0]])
-            return translated
+        with span("translate"):
+            return TRANSLATE_BREAKER.call(_google_translate, text, target_lang)
     except:
         pass
     return text
 
 # --- Google Finance Scraper (Terminal Testine Göre Optimize Edildi) ---
 # --- YFinance Data Fetcher (Single Source of Truth) ---
+QUOTE_BREAKER = get_breaker(
+    "yahoo:quote", failure_threshold=5, reset_timeout=30,
+    probe=lambda: not yf.Ticker("THYAO.IS").history(period="5d").empty
+)
+
 def get_google_finance_data(symbol: str):
+    # Kaynak hata verirse veya devre açıksa son bilinen veri ("stale") döner,
+    # böylece kesinti sırasında istekler zaman aşımı beklemez.
+    # Seans dışında (gece, hafta sonu, tatil) son veri açılışa kadar geçerlidir.
+    original_symbol = symbol.upper()
+    cached = lookup("quote", original_symbol, lambda ts: is_fresh("quote", ts))
+    if cached:
+        return cached
+    try:
+        with span(f"quote {original_symbol}"):
+            data = QUOTE_BREAKER.call(fetch_quote_data, original_symbol)
+    except Exception:
+        return recall("quote", original_symbol)
+    if data is None:
+        return recall("quote", original_symbol)
+    return remember("quote", original_symbol, data)
+
+def fetch_quote_data(symbol: str):
     # Bu fonksiyon tamamen YFinance kullanarak veri çeker.
+    # Hatalar devre kesicinin görmesi için yukarı fırlatılır.
     original_symbol = symbol.upper()
     
     # BIST sembolü düzeltme (.IS ekle)
@@ -87,18 +125,21 @@ def get_google_finance_data(symbol: str):
         # 1. Hacim (Bu kısım aynı kalıyor)
         volume = 0
         try:
-            if hasattr(ticker, 'fast_info') and 'last_volume' in ticker.fast_info:
-                volume = float(ticker.fast_info['last_volume'])
+            with span("yfinance.fast_info"):
+                if hasattr(ticker, 'fast_info') and 'last_volume' in ticker.fast_info:
+                    volume = float(ticker.fast_info['last_volume'])
         except: pass
 
         if volume == 0:
             try:
-                info = ticker.info
+                with span("yfinance.info"):
+                    info = ticker.info
                 volume = info.get('volume') or info.get('regularMarketVolume') or 0
             except: pass
 
         # 2. Tarihçe ve Fiyat (History)
-        hist = ticker.history(period="5d")
+        with span("yfinance.history"):
+            hist = ticker.history(period="5d")
         
         if hist.empty:
             return None
@@ -139,7 +180,8 @@ def get_google_finance_data(symbol: str):
         else:
              sector = "Diğer"
              try:
-                info = ticker.info
+                with span("yfinance.info"):
+                    info = ticker.info
                 fullname = info.get('longName') or info.get('shortName') or original_symbol
                 raw_s = info.get('sector', 'Diğer')
                 sector = SECTOR_TRANSLATIONS.get(raw_s, raw_s) # Çeviri
@@ -169,7 +211,7 @@ def get_google_finance_data(symbol: str):
 
     except Exception as e:
         print(f"Error fetching {original_symbol}: {e}")
-        return None
+        raise
 
 app = FastAPI(title="PhD TERMİNAL Stock Portfolio API")
 
@@ -181,6 +223,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profil kapalıyken sadece tek bir bayrak kontrolü yapılır
+app.add_middleware(ProfilingMiddleware)
+
 DB_FILE = os.path.join(os.path.dirname(__file__), "users.json")
 
 def load_users():
@@ -225,7 +270,8 @@ def load_sector_cache():
 
 def save_sector_cache(cache):
     try:
-        with open(SECTOR_DB_FILE, "w") as f: json.dump(cache, f)
+        with span("cache.write.sectors"):
+            with open(SECTOR_DB_FILE, "w") as f: json.dump(cache, f)
     except: pass
 
 SECTOR_CACHE = load_sector_cache()
@@ -257,6 +303,7 @@ def get_admin_stats():
     }
 
 @app.get("/stocks")
+@span("endpoint.stocks")
 def get_stocks(symbols: Optional[str] = None, page: int = 1, limit: int = 3):
     requested = [s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else []
     
@@ -294,7 +341,7 @@ def get_stocks(symbols: Optional[str] = None, page: int = 1, limit: int = 3):
     # yfinance ile veriyi çekerken sektör bilgisini de alıyoruz.
     results_map = {}
     with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(get_google_finance_data, s): s for s in batch_symbols}
+        futures = {executor.submit(bind_context(get_google_finance_data), s): s for s in batch_symbols}
         for f in futures:
             res = f.result()
             if res: 
@@ -325,7 +372,27 @@ def get_stocks(symbols: Optional[str] = None, page: int = 1, limit: int = 3):
         
     return {"items": final, "has_more": has_more}
 
+SEARCH_BREAKER = get_breaker("yahoo:search", failure_threshold=3, reset_timeout=60, slow_call=2.5)
+
+def _yahoo_search(q):
+    url = f"https://query2.finance.yahoo.com/v1/finance/search?q={q}&quotesCount=5&newsCount=0"
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    with span("yahoo.search"):
+        r = requests.get(url, headers=headers, timeout=3)
+    r.raise_for_status()
+    matches = []
+    for quote in r.json().get("quotes", []):
+        sym = quote.get("symbol")
+        if sym:
+            matches.append({
+                "symbol": sym,
+                "name": quote.get("shortname") or sym,
+                "exchange": quote.get("exchange")
+            })
+    return matches
+
 @app.get("/search/suggestions")
+@span("endpoint.search")
 def search_suggestions(q: str):
     if not q or len(q) < 2: return []
     q = q.upper()
@@ -342,92 +409,199 @@ def search_suggestions(q: str):
         if len(local_matches) >= 5: break
 
     # 2. Küresel Arama (Yahoo Finance Suggestion API - Kayıt gerektirmez)
+    # Devre açıksa sadece yerel sonuçlar döner.
     global_matches = []
     try:
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={q}&quotesCount=5&newsCount=0"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        r = requests.get(url, headers=headers, timeout=3)
-        if r.status_code == 200:
-            data = r.json()
-            for quote in data.get("quotes", []):
-                sym = quote.get("symbol")
-                if sym:
-                    global_matches.append({
-                        "symbol": sym,
-                        "name": quote.get("shortname") or sym,
-                        "exchange": quote.get("exchange")
-                    })
+        global_matches = SEARCH_BREAKER.call(_yahoo_search, q)
     except: pass
 
     # Birleştir ve dön
     return local_matches + global_matches
 
+DETAIL_BREAKER = get_breaker(
+    "yahoo:detail", failure_threshold=3, reset_timeout=30,
+    probe=lambda: bool(yf.Ticker("THYAO.IS").info)
+)
+
 @app.get("/stocks/{symbol}/detail")
+@span("endpoint.detail")
 def get_stock_detail(symbol: str):
     original_symbol = symbol.upper()
+    cached = lookup("detail", original_symbol, lambda ts: is_fresh("detail", ts))
+    if cached:
+        return cached
+    try:
+        data = DETAIL_BREAKER.call(fetch_stock_detail, original_symbol)
+    except Exception as e:
+        print(f"Detail error: {e}")
+        stale = recall("detail", original_symbol)
+        if stale:
+            return stale
+        if isinstance(e, CircuitOpenError):
+            raise HTTPException(status_code=503, detail="Veri kaynağına şu an ulaşılamıyor")
+        raise HTTPException(status_code=404, detail="Hisse detayları alınamadı")
+
+    # Çeviri kendi devresiyle, Yahoo çağrısının süresine dahil edilmeden yapılır
+    data["description"] = translate_text(data["description"])
+    return remember("detail", original_symbol, data)
+
+def fetch_stock_detail(original_symbol: str):
     yf_symbol = original_symbol
     if "." not in yf_symbol:
         yf_symbol = f"{original_symbol}.IS"
         
-    try:
-        ticker = yf.Ticker(yf_symbol)
+    ticker = yf.Ticker(yf_symbol)
+    with span("yfinance.info"):
         info = ticker.info
+    
+    # Güvenli veri çekme yardımcı fonksiyonu
+    def get_val(key, default="-"):
+        return info.get(key, default)
+
+    # Temel veriler
+    raw_sector = get_val("sector")
+    raw_industry = get_val("industry")
+    raw_description = get_val("longBusinessSummary", "Şirket açıklaması bulunamadı.")
+
+    data = {
+        "symbol": original_symbol,
+        "name": get_val("longName", get_val("shortName")),
+        "description": raw_description,
+        "sector": SECTOR_TRANSLATIONS.get(raw_sector, raw_sector),
+        "industry": INDUSTRY_TRANSLATIONS.get(raw_industry, raw_industry),
+        "website": get_val("website"),
+        "logo_url": get_val("logo_url", ""), 
+        "price": get_val("currentPrice", get_val("regularMarketPrice", 0)),
+        "currency": get_val("currency", "TRY"),
         
-        # Güvenli veri çekme yardımcı fonksiyonu
-        def get_val(key, default="-"):
-            return info.get(key, default)
-
-        # Temel veriler
-        raw_sector = get_val("sector")
-        raw_industry = get_val("industry")
-        raw_description = get_val("longBusinessSummary", "Şirket açıklaması bulunamadı.")
-
-        data = {
-            "symbol": original_symbol,
-            "name": get_val("longName", get_val("shortName")),
-            "description": translate_text(raw_description),
-            "sector": SECTOR_TRANSLATIONS.get(raw_sector, raw_sector),
-            "industry": INDUSTRY_TRANSLATIONS.get(raw_industry, raw_industry),
-            "website": get_val("website"),
-            "logo_url": get_val("logo_url", ""), 
-            "price": get_val("currentPrice", get_val("regularMarketPrice", 0)),
-            "currency": get_val("currency", "TRY"),
-            
-            # Finansallar
-            "marketCap": get_val("marketCap", 0),
-            "peRatio": get_val("trailingPE", 0),
-            "dividendYield": get_val("dividendYield", 0),
-            
-            # Günlük / Yıllık Aralık
-            "dayHigh": get_val("dayHigh", 0),
-            "dayLow": get_val("dayLow", 0),
-            "fiftyTwoWeekHigh": get_val("fiftyTwoWeekHigh", 0),
-            "fiftyTwoWeekLow": get_val("fiftyTwoWeekLow", 0),
-            "averageVolume": get_val("averageVolume", 0),
-            "open": get_val("open", 0),
-            "previousClose": get_val("previousClose", 0)
-        }
+        # Finansallar
+        "marketCap": get_val("marketCap", 0),
+        "peRatio": get_val("trailingPE", 0),
+        "dividendYield": get_val("dividendYield", 0),
         
-        # Değişim hesapla (Eğer info'da yoksa manuel)
-        if data["price"] and data["previousClose"]:
-            data["change"] = data["price"] - data["previousClose"]
-            data["changePercent"] = (data["change"] / data["previousClose"]) * 100
-        else:
-            data["change"] = 0
-            data["changePercent"] = 0
-            
-        return data
-    except Exception as e:
-        print(f"Detail error: {e}")
-        raise HTTPException(status_code=404, detail="Hisse detayları alınamadı")
+        # Günlük / Yıllık Aralık
+        "dayHigh": get_val("dayHigh", 0),
+        "dayLow": get_val("dayLow", 0),
+        "fiftyTwoWeekHigh": get_val("fiftyTwoWeekHigh", 0),
+        "fiftyTwoWeekLow": get_val("fiftyTwoWeekLow", 0),
+        "averageVolume": get_val("averageVolume", 0),
+        "open": get_val("open", 0),
+        "previousClose": get_val("previousClose", 0)
+    }
+    
+    # Değişim hesapla (Eğer info'da yoksa manuel)
+    if data["price"] and data["previousClose"]:
+        data["change"] = data["price"] - data["previousClose"]
+        data["changePercent"] = (data["change"] / data["previousClose"]) * 100
+    else:
+        data["change"] = 0
+        data["changePercent"] = 0
+        
+    return data
 
 @app.get("/stocks/{symbol}/financials")
+@span("endpoint.financials")
 def get_financials(symbol: str):
     data = get_stock_financials(symbol)
     if not data:
         raise HTTPException(status_code=404, detail="Mali tablolar bulunamadı")
     return data
 
+# --- Korelasyon ve Beta Analitiği ---
+@app.get("/analytics/correlation")
+@span("endpoint.analytics.correlation")
+def analytics_correlation(symbols: Optional[str] = None, window: int = DEFAULT_WINDOW):
+    requested = [s.strip() for s in symbols.split(",") if s.strip()] if symbols else None
+    try:
+        data = get_correlation_matrix(window, requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not data:
+        raise HTTPException(status_code=404, detail="Fiyat geçmişi henüz hazır değil")
+    return data
+
+@app.get("/analytics/similar/{symbol}")
+@span("endpoint.analytics.similar")
+def analytics_similar(symbol: str, window: int = DEFAULT_WINDOW, limit: int = 10):
+    try:
+        data = get_similar_stocks(symbol, window, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not data:
+        raise HTTPException(status_code=404, detail="Hisse için fiyat geçmişi bulunamadı")
+    return data
+
+@app.get("/analytics/beta")
+@span("endpoint.analytics.beta")
+def analytics_betas(window: int = DEFAULT_WINDOW):
+    try:
+        data = get_all_betas(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not data:
+        raise HTTPException(status_code=404, detail="Fiyat geçmişi henüz hazır değil")
+    return data
+
+@app.get("/analytics/beta/{symbol}")
+@span("endpoint.analytics.beta")
+def analytics_beta(symbol: str, window: int = DEFAULT_WINDOW):
+    try:
+        data = get_rolling_beta(symbol, window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not data:
+        raise HTTPException(status_code=404, detail="Hisse için fiyat geçmişi bulunamadı")
+    return data
+
+@app.get("/admin/profiling")
+def get_profiling():
+    return {"config": profiling.get_status(), "requests": profiling.get_slow_requests()}
+
+@app.post("/admin/profiling")
+def set_profiling(data: dict = Body(...)):
+    try:
+        return profiling.configure(
+            enabled=data.get("enabled"),
+            sample_rate=data.get("sample_rate"),
+            interval_ms=data.get("interval_ms"),
+            min_duration_ms=data.get("min_duration_ms"),
+            max_requests=data.get("max_requests"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/profiling/clear")
+def clear_profiling():
+    profiling.clear()
+    return {"status": "ok"}
+
+@app.get("/admin/profiling/requests/{request_id}")
+def get_profiled_request(request_id: int):
+    data = profiling.get_request_profile(request_id)
+    if not data:
+        raise HTTPException(status_code=404, detail="Kayıt bulunamadı")
+    return data
+
+@app.get("/admin/profiling/requests/{request_id}/stacks", response_class=PlainTextResponse)
+def get_profiled_stacks(request_id: int):
+    # flamegraph.pl / speedscope ile açılabilen "folded" yığınlar
+    stacks = profiling.get_folded_stacks(request_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="Kayıt bulunamadı")
+    return PlainTextResponse(stacks, headers={"Content-Disposition": f"attachment; filename=request-{request_id}.folded"})
+
+@app.get("/admin/market-calendar")
+def get_market_calendar():
+    return get_calendar_status()
+
+@app.get("/admin/circuits")
+def get_circuits():
+    return get_breaker_statuses()
+
+@app.get("/admin/analytics")
+def get_analytics_info():
+    return get_history_info()
+
 DEFAULT_STOCKS = [
     "A1CAP.IS", "ACSEL.IS", "ADEL.IS", "ADESE.IS", "ADGYO.IS", "AEFES.IS", "AFYON.IS", "AGESA.IS", "AGHOL.IS", "AGYO.IS", "AHGAZ.IS", "AKBNK.IS", "AKCNS.IS", "AKENR.IS", "AKFGY.IS", "AKFYE.IS", "AKGRT.IS", "AKMGY.IS", "AKSA.IS", "AKSEN.IS", "AKSGY.IS", "AKSUE.IS", "AKYHO.IS", "ALARK.IS", "ALBRK.IS", "ALCAR.IS", "ALCTL.IS", "ALFAS.IS", "ALGYO.IS", "ALKA.IS", "ALKIM.IS", "ALMAD.IS",
     "ALPF.IS", "ALTNY.IS", "ANELE.IS", "ANGEN.IS", "ANHYT.IS", "ANSGR.IS", "ARASE.IS", "ARCLK.IS", "ARDYZ.IS", "ARENA.IS", "ARSAN.IS", "ARTMS.IS", "ARZUM.IS", "ASELS.IS", "ASGYO.IS", "ASTOR.IS", "ASUZU.IS", "ATAGY.IS", "ATAKP.IS", "ATP.IS", "AVGYO.IS", "AVHOL.IS", "AVOD.IS", "AVPGY.IS", "AYCES.IS", "AYDEM.IS", "AYEN.IS", "AYES.IS", "AYGAZ.IS", "AZTEK.IS",
@@ -472,27 +646,84 @@ ALL_BIST_STOCKS = [
 # Sektörel Gruplandırma İçin Bekleme
 # Bu fonksiyon arka planda sektörleri tarayıp cache'i dolduracak
 import threading
+SECTOR_SCAN_FILE = os.path.join(os.path.dirname(__file__), "sector_scan.json")
+
+def load_last_sector_scan():
+    if os.path.exists(SECTOR_SCAN_FILE):
+        try:
+            with open(SECTOR_SCAN_FILE, "r") as f: return json.load(f).get("last_scan", 0)
+        except: pass
+    return 0
+
+def save_last_sector_scan(ts):
+    try:
+        with open(SECTOR_SCAN_FILE, "w") as f: json.dump({"last_scan": ts}, f)
+    except: pass
+
 def init_stock_cache():
-    print("--- Stok Cache Güncellemesi Başladı ---")
+    # Sadece sektörü bilinmeyen hisseler taranır; son taramadan bu yana
+    # SECTOR_RESCAN geçmediyse her yeniden başlatmada tekrar taranmaz.
+    missing = [
+        s for s in ALL_BIST_STOCKS
+        if s not in SECTOR_CACHE and s.replace(".IS", "") not in SECTOR_CACHE
+    ]
+    if not missing:
+        return
+    if time.time() - load_last_sector_scan() < SECTOR_RESCAN.total_seconds():
+        print(f"--- Sektör taraması atlandı ({len(missing)} hisse bekliyor) ---")
+        return
+
+    print(f"--- Stok Cache Güncellemesi Başladı ({len(missing)} hisse) ---")
     
     # 1. Hisseleri Tarayalım (Sektörleri Öğrenmek İçin)
     def fetch_sector_only(symbol):
-        if symbol in SECTOR_CACHE: return # Zaten biliyoruz
+        # Cache'teki taze fiyat atlanır: sektör ancak kaynaktan çekilirken
+        # SECTOR_CACHE'e yazılır, aksi halde tarama hiç istek atmadan "tamamlanır".
         try:
-            get_google_finance_data(symbol) # Bu fonksiyon veriyi çekerken cache'i de güncelliyor
+            remember("quote", symbol.upper(), QUOTE_BREAKER.call(fetch_quote_data, symbol))
         except: pass
 
     # Thread Pool ile Hızlıca Tarama (Rate Limit İçin Yavaşlatıldı)
+    # Yahoo devresi açılırsa tarama durdurulur ve tamamlandı sayılmaz.
+    aborted = False
     with ThreadPoolExecutor(max_workers=3) as executor:
-        for symbol in ALL_BIST_STOCKS:
+        for symbol in missing:
+            if QUOTE_BREAKER.state != QUOTE_BREAKER.CLOSED:
+                aborted = True
+                break
             executor.submit(fetch_sector_only, symbol)
             time.sleep(2) # Her istek arası 2 saniye bekle
     
+    if aborted:
+        print("--- Stok Cache Güncellemesi Durduruldu (Yahoo erişilemiyor) ---")
+        return
+    save_last_sector_scan(time.time())
     print("--- Stok Cache Güncellemesi Bitti ---")
 
 
+# Fiyat geçmişini (korelasyon/beta için) günlük bar kesinleşince güncelle.
+# Sadece son kayıtlı günden sonrası indirilir, matrisler artımlı güncellenir.
+# Günlük barlar ancak seans kapanışında değişir; bir sonraki kapanışa kadar beklenir.
+PRICE_HISTORY_RETRY = 30 * 60
+
+def price_history_loop():
+    while True:
+        added = None
+        try:
+            added = update_price_history(ALL_BIST_STOCKS)
+            if added is not None:
+                print(f"--- Fiyat geçmişi güncellendi ({added} gün) ---")
+        except Exception as e:
+            print(f"Fiyat geçmişi hatası: {e}")
+        if added is None:
+            time.sleep(PRICE_HISTORY_RETRY)
+        else:
+            time.sleep(seconds_until_history_refresh())
+
+
 # Uygulama Başlarken Cache'i Başlat
 threading.Thread(target=init_stock_cache, daemon=True).start()
+threading.Thread(target=price_history_loop, daemon=True).start()
 
 # Frontend Tarafından Kullanılan Default Stocks (Artık Dinamik)
 DEFAULT_STOCKS = ALL_BIST_STOCKS
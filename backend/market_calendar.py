@@ -0,0 +1,198 @@
+from datetime import datetime, date, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+# --- Borsa İstanbul Takvimi ---
+# Seans saatleri, resmi/dini tatiller ve çeyreklik bilanço yayın
+# pencereleri. Cache süreleri ve arka plan güncelleme sıklığı buradan
+# belirlenir; piyasa kapalıyken veya yeni bilanço beklenmiyorken dış
+# kaynağa istek atılmaz.
+
+BIST_TZ = ZoneInfo("Europe/Istanbul")
+
+SESSION_OPEN = dtime(10, 0)
+SESSION_CLOSE = dtime(18, 10)      # Kapanış seansı dahil
+HALF_DAY_CLOSE = dtime(12, 40)     # Arife günleri (yarım gün)
+# Kapanış fiyatlarının kesinleşmesi için pay. Yahoo'nun .IS verisi ~15 dk
+# gecikmeli geldiğinden, kapanıştan hemen sonra çekilen fiyat kapanış
+# seansından önceki olabilir; bu süre boyunca seans içi kısa TTL geçerlidir.
+SETTLE = timedelta(minutes=30)
+
+# Seans içindeki cache süreleri (saniye). Seans dışında veri bir sonraki
+# açılışa kadar geçerlidir.
+SESSION_TTL = {
+    "quote": 60,
+    "detail": 300,
+}
+
+SECTOR_RESCAN = timedelta(days=7)  # Sektörü bilinmeyen hisseler için yeniden tarama
+
+# Sabit tarihli resmi tatiller (ay, gün)
+FIXED_HOLIDAYS = {(1, 1), (4, 23), (5, 1), (5, 19), (7, 15), (8, 30), (10, 29)}
+FIXED_HALF_DAYS = {(10, 28)}
+
+# Ramazan ve Kurban Bayramları (her yıl değişir)
+RELIGIOUS_HOLIDAYS = {
+    # 2024
+    date(2024, 4, 10), date(2024, 4, 11), date(2024, 4, 12),
+    date(2024, 6, 16), date(2024, 6, 17), date(2024, 6, 18), date(2024, 6, 19),
+    # 2025
+    date(2025, 3, 30), date(2025, 3, 31), date(2025, 4, 1),
+    date(2025, 6, 6), date(2025, 6, 7), date(2025, 6, 8), date(2025, 6, 9),
+    # 2026
+    date(2026, 3, 20), date(2026, 3, 21), date(2026, 3, 22),
+    date(2026, 5, 27), date(2026, 5, 28), date(2026, 5, 29), date(2026, 5, 30),
+    # 2027
+    date(2027, 3, 9), date(2027, 3, 10), date(2027, 3, 11),
+    date(2027, 5, 16), date(2027, 5, 17), date(2027, 5, 18), date(2027, 5, 19),
+}
+RELIGIOUS_HALF_DAYS = {
+    date(2024, 4, 9), date(2024, 6, 15),
+    date(2025, 3, 29), date(2025, 6, 5),
+    date(2026, 3, 19), date(2026, 5, 26),
+    date(2027, 3, 8), date(2027, 5, 15),
+}
+
+# Çeyreklik bilanço yayın pencereleri: dönem sonundan itibaren (başlangıç, bitiş) gün.
+# Yıllık (12) tablolar bağımsız denetim nedeniyle daha geç açıklanır.
+REPORTING_WINDOWS = {
+    3: (30, 70),
+    6: (30, 70),
+    9: (30, 70),
+    12: (30, 100),
+}
+
+
+def now_tr():
+    return datetime.now(BIST_TZ)
+
+
+def is_holiday(d):
+    return (d.month, d.day) in FIXED_HOLIDAYS or d in RELIGIOUS_HOLIDAYS
+
+
+def is_trading_day(d):
+    return d.weekday() < 5 and not is_holiday(d)
+
+
+def session_bounds(d):
+    """
+    Verilen gün için (açılış, kapanış) zamanları; işlem günü değilse None.
+    """
+    if not is_trading_day(d):
+        return None
+    half = (d.month, d.day) in FIXED_HALF_DAYS or d in RELIGIOUS_HALF_DAYS
+    close = HALF_DAY_CLOSE if half else SESSION_CLOSE
+    return (
+        datetime.combine(d, SESSION_OPEN, tzinfo=BIST_TZ),
+        datetime.combine(d, close, tzinfo=BIST_TZ),
+    )
+
+
+def is_market_open(now=None):
+    now = now or now_tr()
+    bounds = session_bounds(now.date())
+    return bool(bounds) and bounds[0] <= now < bounds[1]
+
+
+def is_live(now=None):
+    """
+    Fiyatların değişebileceği dönem: seans + gecikmeli verinin kesinleşme payı.
+    """
+    now = now or now_tr()
+    bounds = session_bounds(now.date())
+    return bool(bounds) and bounds[0] <= now < bounds[1] + SETTLE
+
+
+def next_session_open(after=None):
+    after = after or now_tr()
+    d = after.date()
+    for _ in range(30):
+        bounds = session_bounds(d)
+        if bounds and bounds[0] > after:
+            return bounds[0]
+        d += timedelta(days=1)
+    return after + timedelta(days=1)
+
+
+def next_session_end(after=None):
+    """
+    `after` sonrasındaki ilk kesinleşmiş kapanış (kapanış + SETTLE).
+    """
+    after = after or now_tr()
+    d = after.date()
+    for _ in range(30):
+        bounds = session_bounds(d)
+        if bounds and bounds[1] + SETTLE > after:
+            return bounds[1] + SETTLE
+        d += timedelta(days=1)
+    return after + timedelta(days=1)
+
+
+def last_settled_session(now=None):
+    """
+    Kapanışı kesinleşmiş (kapanış + SETTLE geçmiş) son işlem günü.
+    Bu tarihten sonraki günlük barlar seans içi / geçicidir.
+    """
+    now = now or now_tr()
+    d = now.date()
+    for _ in range(30):
+        bounds = session_bounds(d)
+        if bounds and bounds[1] + SETTLE <= now:
+            return d
+        d -= timedelta(days=1)
+    return d
+
+
+def valid_until(kind, fetched_at):
+    """
+    `fetched_at` (unix zamanı) anında çekilmiş verinin geçerli olduğu son an.
+    Seans içinde (ve kesinleşme payı boyunca) kısa TTL; sonrasında bir
+    sonraki açılışa kadar.
+    """
+    fetched = datetime.fromtimestamp(fetched_at, BIST_TZ)
+    if is_live(fetched):
+        return fetched_at + SESSION_TTL[kind]
+    return next_session_open(fetched).timestamp()
+
+
+def is_fresh(kind, fetched_at, now=None):
+    now = now or now_tr()
+    return now.timestamp() < valid_until(kind, fetched_at)
+
+
+def seconds_until_history_refresh(now=None):
+    """
+    Günlük barlar ancak seans kapanınca değişir; bir sonraki kapanışa kadar bekle.
+    """
+    now = now or now_tr()
+    return max(60, (next_session_end(now) - now).total_seconds())
+
+
+def reporting_window(year, period):
+    """
+    (yıl, çeyrek sonu ayı) dönemi için bilançoların açıklanması beklenen tarih aralığı.
+    """
+    if period == 12:
+        period_end = date(year, 12, 31)
+    else:
+        period_end = date(year, period + 1, 1) - timedelta(days=1)
+    start, end = REPORTING_WINDOWS[period]
+    return period_end + timedelta(days=start), period_end + timedelta(days=end)
+
+
+def next_quarter(year, period):
+    if period == 12:
+        return year + 1, 3
+    return year, period + 3
+
+
+def get_calendar_status(now=None):
+    now = now or now_tr()
+    return {
+        "now": now.isoformat(),
+        "market_open": is_market_open(now),
+        "trading_day": is_trading_day(now.date()),
+        "next_open": next_session_open(now).isoformat(),
+        "next_close": next_session_end(now).isoformat(),
+        "session_ttl": SESSION_TTL,
+    }
@@ -0,0 +1,300 @@
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- İstek Profilleme ---
+# Admin panelinden çalışma anında açılır. Açıkken örneklenen her istek için
+# bir span ağacı (yfinance, çeviri, cache yazma vb.) ve istatistiksel
+# örnekleyiciyle toplanan yığınlar (flamegraph "folded" formatı) tutulur.
+# En yavaş istekler sınırlı bir yığında (heap) saklanır.
+# Kapalıyken `span` sadece bir ContextVar okuması yapar.
+
+PROFILER = {
+    "enabled": False,
+    "sample_rate": 1.0,       # Profillenecek isteklerin oranı (0-1)
+    "interval_ms": 5,         # Örnekleyici aralığı
+    "min_duration_ms": 0,     # Bundan hızlı istekler saklanmaz
+    "max_requests": 50,       # Saklanan en yavaş istek sayısı
+}
+
+_CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+_ACTIVE_THREADS = {}          # thread id -> profillenen istek kaydı
+_SLOWEST = []                 # (süre, sıra, kayıt) min-heap
+_SEQ = itertools.count(1)
+_LOCK = threading.Lock()
+_SAMPLER = None
+
+# Admin panelinin kendi istekleri "en yavaş istekler" listesini doldurmasın
+SKIP_PREFIXES = ("/admin/profiling",)
+
+
+class _Span:
+    __slots__ = ("name", "record", "start", "end", "children", "error")
+
+    def __init__(self, name, record):
+        self.name = name
+        self.record = record
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.error = None
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round((end - self.start) * 1000, 2),
+            "error": self.error,
+            "children": [c.to_dict(origin) for c in self.children],
+        }
+
+
+@contextmanager
+def span(name):
+    """
+    Profillenen bir isteğin içindeysek alt span açar; değilsek hiçbir şey yapmaz.
+    Dekoratör olarak da kullanılabilir: @span("endpoint.stocks")
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield
+        return
+
+    child = _Span(name, parent.record)
+    parent.children.append(child)
+    token = _CURRENT_SPAN.set(child)
+    tid = threading.get_ident()
+    prev = _ACTIVE_THREADS.get(tid)
+    _ACTIVE_THREADS[tid] = parent.record
+    try:
+        yield
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+        if prev is None:
+            _ACTIVE_THREADS.pop(tid, None)
+        else:
+            _ACTIVE_THREADS[tid] = prev
+
+
+def bind_context(fn):
+    """
+    ThreadPoolExecutor'a gönderilen işlerin aktif span'e bağlanması için.
+    Her gönderimde ayrı çağrılmalı (bağlam kopyası gönderim anında alınır).
+    """
+    if _CURRENT_SPAN.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def start_request(method, path, query=""):
+    """
+    Profil açıksa ve istek örneklemeye girdiyse kök span'i başlatır.
+    Dönen değer `finish_request`e verilmelidir; profil dışıysa None.
+    """
+    if not PROFILER["enabled"] or path.startswith(SKIP_PREFIXES):
+        return None
+    if random.random() >= PROFILER["sample_rate"]:
+        return None
+    record = {
+        "id": next(_SEQ),
+        "method": method,
+        "path": path,
+        "query": query,
+        "started": datetime.now().isoformat(),
+        "status": None,
+        "duration_ms": None,
+        "stacks": Counter(),
+    }
+    root = _Span(f"{method} {path}", record)
+    record["root"] = root
+    token = _CURRENT_SPAN.set(root)
+    return record, token
+
+
+def finish_request(handle, status=None, error=None):
+    record, token = handle
+    root = record["root"]
+    root.end = time.perf_counter()
+    root.error = error
+    _CURRENT_SPAN.reset(token)
+
+    record["status"] = status
+    record["duration_ms"] = round((root.end - root.start) * 1000, 2)
+    if record["duration_ms"] < PROFILER["min_duration_ms"]:
+        return
+    with _LOCK:
+        item = (record["duration_ms"], record["id"], record)
+        if len(_SLOWEST) < PROFILER["max_requests"]:
+            heapq.heappush(_SLOWEST, item)
+        elif item > _SLOWEST[0]:
+            heapq.heapreplace(_SLOWEST, item)
+
+
+class ProfilingMiddleware:
+    """
+    Saf ASGI middleware: profil kapalıyken isteği olduğu gibi iletir
+    (ek task veya yanıt sarmalama yok). Açıkken yanıt durum kodunu
+    `send` üzerinden yakalar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILER["enabled"]:
+            return await self.app(scope, receive, send)
+        handle = start_request(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        if handle is None:
+            return await self.app(scope, receive, send)
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            finish_request(handle, 500, f"{type(e).__name__}: {e}")
+            raise
+        finish_request(handle, status.get("code"))
+
+
+# --- İstatistiksel Örnekleyici ---
+
+def _folded_stack(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _sampler_loop():
+    me = threading.get_ident()
+    while PROFILER["enabled"]:
+        time.sleep(PROFILER["interval_ms"] / 1000)
+        if not _ACTIVE_THREADS:
+            continue
+        frames = sys._current_frames()
+        for tid, record in list(_ACTIVE_THREADS.items()):
+            frame = frames.get(tid)
+            if frame is not None and tid != me:
+                record["stacks"][_folded_stack(frame)] += 1
+
+
+# Ayar -> (tip, geçerlilik kontrolü, hata mesajı)
+_OPTION_RULES = {
+    "sample_rate": (float, lambda v: 0 < v <= 1, "0 < sample_rate <= 1 olmalı"),
+    "interval_ms": (int, lambda v: v >= 1, "interval_ms >= 1 olmalı"),
+    "min_duration_ms": (int, lambda v: v >= 0, "min_duration_ms >= 0 olmalı"),
+    "max_requests": (int, lambda v: v >= 1, "max_requests >= 1 olmalı"),
+}
+
+
+def _validate_options(enabled, options):
+    """
+    Tüm ayarları değiştirmeden önce doğrular; hatalıysa ValueError fırlatır.
+    """
+    if enabled is not None and not isinstance(enabled, bool):
+        raise ValueError("enabled true/false olmalı")
+    parsed = {}
+    for key, value in options.items():
+        if value is None:
+            continue
+        if key not in _OPTION_RULES:
+            raise ValueError(f"Bilinmeyen ayar: {key}")
+        cast, check, message = _OPTION_RULES[key]
+        if isinstance(value, bool):
+            raise ValueError(message)
+        try:
+            value = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(message)
+        if not check(value):
+            raise ValueError(message)
+        parsed[key] = value
+    return parsed
+
+
+def configure(enabled=None, **options):
+    """
+    Profil ayarlarını günceller; açılınca örnekleyici thread'i başlatılır.
+    Geçersiz bir değer varsa hiçbir ayar değiştirilmeden ValueError fırlatılır.
+    """
+    global _SAMPLER
+    parsed = _validate_options(enabled, options)
+    PROFILER.update(parsed)
+    if enabled is not None:
+        PROFILER["enabled"] = enabled
+    if PROFILER["enabled"] and (_SAMPLER is None or not _SAMPLER.is_alive()):
+        _SAMPLER = threading.Thread(target=_sampler_loop, daemon=True)
+        _SAMPLER.start()
+    with _LOCK:
+        while len(_SLOWEST) > PROFILER["max_requests"]:
+            heapq.heappop(_SLOWEST)
+    return get_status()
+
+
+def clear():
+    with _LOCK:
+        _SLOWEST.clear()
+
+
+def get_status():
+    return dict(PROFILER, captured=len(_SLOWEST))
+
+
+def _summary(record):
+    return {k: record[k] for k in ("id", "method", "path", "query", "started", "status", "duration_ms")} | {
+        "samples": sum(record["stacks"].values()),
+    }
+
+
+def get_slow_requests():
+    with _LOCK:
+        records = [item[2] for item in sorted(_SLOWEST, reverse=True)]
+    return [_summary(r) for r in records]
+
+
+def _find(request_id):
+    with _LOCK:
+        for _, _, record in _SLOWEST:
+            if record["id"] == request_id:
+                return record
+    return None
+
+
+def get_request_profile(request_id):
+    record = _find(request_id)
+    if not record:
+        return None
+    root = record["root"]
+    return _summary(record) | {"spans": root.to_dict(root.start)}
+
+
+def get_folded_stacks(request_id):
+    """
+    flamegraph.pl / speedscope ile açılabilen "folded" yığın metni.
+    """
+    record = _find(request_id)
+    if record is None:
+        return None
+    return "\n".join(f"{stack} {count}" for stack, count in record["stacks"].most_common())